@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -162,3 +163,24 @@ SIMPLE_JWT = {
 }
 
 AUTH_USER_MODEL = 'credit_card.User'
+
+# SECURITY WARNING: stored card numbers and CVVs can only be decrypted with
+# the master key that wrapped them. Never change or remove a key in
+# MASTER_KEYS: to rotate, add a new key id, point ACTIVE_MASTER_KEY_ID at it
+# and keep the old one. The default below is for local development only.
+CARD_ENCRYPTION = {
+    'ACTIVE_MASTER_KEY_ID': 'local-1',
+    'MASTER_KEYS': {
+        'local-1': os.environ.get('CARD_ENCRYPTION_MASTER_KEY',
+                                  'django-insecure-card-master-key-ue3k$8!pq2@z7w'),
+    },
+    'DATA_KEY_MAX_USES': 100000,
+    'DATA_KEY_MAX_AGE': 3600,
+}
+
+REQUEST_PROFILING = {
+    # Profile 1 request in SAMPLE_RATE automatically, 0 disables sampling.
+    'SAMPLE_RATE': 0,
+    'DIRECTORY': BASE_DIR / 'profiles',
+    'MAX_PROFILES': 50,
+}
@@ -15,7 +15,15 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from credit_card.views import CreditCardView, HolderView, UserCreateView
+from credit_card.views import (CreditCardView,
+                               CreditCardBatchView,
+                               CreditCardExpiringView,
+                               HolderView,
+                               HolderBatchView,
+                               HolderBulkUpsertView,
+                               HolderCardsView,
+                               ProfileView,
+                               UserCreateView)
 from rest_framework.authtoken.views import obtain_auth_token
 from rest_framework import routers
 from drf_yasg.views import get_schema_view
@@ -39,8 +47,14 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('credit-cards/', CreditCardView.as_view(), name='credit-card-list'),
     path('credit-cards/<int:pk>/', CreditCardView.as_view(), name='credit-card-detail'),
+    path('credit-cards/expiring/', CreditCardExpiringView.as_view(), name='credit-card-expiring'),
+    path('credit-cards/batch/', CreditCardBatchView.as_view(), name='credit-card-batch'),
     path('holders/', HolderView.as_view(), name='holder-list'),
     path('holders/<int:pk>/', HolderView.as_view(), name='holder-detail'),
+    path('holders/<int:pk>/cards/', HolderCardsView.as_view(), name='holder-cards'),
+    path('holders/batch/', HolderBatchView.as_view(), name='holder-batch'),
+    path('holders/bulk/', HolderBulkUpsertView.as_view(), name='holder-bulk-upsert'),
+    path('profiles/<uuid:pk>/', ProfileView.as_view(), name='profile-detail'),
     path('sign-up/', UserCreateView.as_view(), name='user-create'),
     path('api/token/', obtain_auth_token, name='api_token_auth'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
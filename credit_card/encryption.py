@@ -0,0 +1,174 @@
+import base64
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from django.conf import settings
+
+
+TOKEN_PREFIX = 'enc1'
+TOKEN_SEPARATOR = '$'
+NONCE_SIZE = 12
+KEY_SIZE = 32
+
+
+def b64encode(value):
+    return base64.urlsafe_b64encode(value).decode('ascii')
+
+
+def b64decode(value):
+    return base64.urlsafe_b64decode(value.encode('ascii'))
+
+
+class LocalKeyStore:
+    # Stand-in for a KMS: master keys never leave this object, only
+    # wrapped (encrypted) data keys do.
+
+    def __init__(self, master_keys, active_key_id):
+        if active_key_id not in master_keys:
+            raise ValueError('The active master key must be in the keystore.')
+        if any(TOKEN_SEPARATOR in key_id for key_id in master_keys):
+            raise ValueError(f'Master key ids cannot contain {TOKEN_SEPARATOR}.')
+        self.active_key_id = active_key_id
+        self._master_keys = {key_id: AESGCM(self._derive_key(secret))
+                             for key_id, secret in master_keys.items()}
+
+    @staticmethod
+    def _derive_key(secret):
+        if isinstance(secret, str):
+            secret = secret.encode('utf-8')
+        hkdf = HKDF(algorithm=hashes.SHA256(), length=KEY_SIZE,
+                    salt=None, info=b'credit-card-master-key')
+        return hkdf.derive(secret)
+
+    def wrap(self, data_key):
+        nonce = os.urandom(NONCE_SIZE)
+        master_key = self._master_keys[self.active_key_id]
+        wrapped = nonce + master_key.encrypt(nonce, data_key, self.active_key_id.encode('utf-8'))
+        return self.active_key_id, wrapped
+
+    def unwrap(self, key_id, wrapped):
+        try:
+            master_key = self._master_keys[key_id]
+        except KeyError:
+            raise ValueError(f'Unknown master key {key_id}.')
+        nonce, ciphertext = wrapped[:NONCE_SIZE], wrapped[NONCE_SIZE:]
+        return master_key.decrypt(nonce, ciphertext, key_id.encode('utf-8'))
+
+
+class DataKey:
+    def __init__(self, key_id, wrapped, plaintext):
+        self.key_id = key_id
+        self.wrapped = wrapped
+        self.token_prefix = TOKEN_SEPARATOR.join(
+            [TOKEN_PREFIX, key_id, b64encode(wrapped)])
+        self.cipher = AESGCM(plaintext)
+        self.created_at = time.monotonic()
+        self.uses = 0
+
+
+class EncryptionEngine:
+    def __init__(self, keystore, max_uses=100000, max_age=3600, cache_size=128):
+        self.keystore = keystore
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self._current_key = None
+        self._key_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_encrypted(value):
+        return isinstance(value, str) and value.startswith(TOKEN_PREFIX + TOKEN_SEPARATOR)
+
+    def rotate(self):
+        with self._lock:
+            self._current_key = self._new_data_key()
+            return self._current_key
+
+    def _new_data_key(self):
+        plaintext = AESGCM.generate_key(bit_length=KEY_SIZE * 8)
+        key_id, wrapped = self.keystore.wrap(plaintext)
+        data_key = DataKey(key_id, wrapped, plaintext)
+        self._remember(data_key)
+        return data_key
+
+    def _remember(self, data_key):
+        self._key_cache[data_key.token_prefix] = data_key
+        self._key_cache.move_to_end(data_key.token_prefix)
+        while len(self._key_cache) > self.cache_size:
+            self._key_cache.popitem(last=False)
+
+    def _reserve_key(self, count):
+        with self._lock:
+            data_key = self._current_key
+            if (data_key is None
+                    or data_key.key_id != self.keystore.active_key_id
+                    or data_key.uses + count > self.max_uses
+                    or time.monotonic() - data_key.created_at > self.max_age):
+                data_key = self._current_key = self._new_data_key()
+            data_key.uses += count
+            return data_key
+
+    def _get_key(self, key_id, wrapped_b64):
+        token_prefix = TOKEN_SEPARATOR.join([TOKEN_PREFIX, key_id, wrapped_b64])
+        with self._lock:
+            data_key = self._key_cache.get(token_prefix)
+            if data_key is not None:
+                self._key_cache.move_to_end(token_prefix)
+                return data_key
+
+            wrapped = b64decode(wrapped_b64)
+            data_key = DataKey(key_id, wrapped, self.keystore.unwrap(key_id, wrapped))
+            self._remember(data_key)
+            return data_key
+
+    def encrypt(self, value, associated_data=None):
+        return self.encrypt_many([value], associated_data)[0]
+
+    def encrypt_many(self, values, associated_data=None):
+        values = list(values)
+        data_key = self._reserve_key(len(values))
+        aad = associated_data.encode('utf-8') if associated_data else None
+        tokens = []
+        for value in values:
+            if value is None or self.is_encrypted(value):
+                tokens.append(value)
+                continue
+            nonce = os.urandom(NONCE_SIZE)
+            ciphertext = data_key.cipher.encrypt(nonce, str(value).encode('utf-8'), aad)
+            tokens.append(TOKEN_SEPARATOR.join(
+                [data_key.token_prefix, b64encode(nonce + ciphertext)]))
+        return tokens
+
+    def decrypt(self, value, associated_data=None):
+        return self.decrypt_many([value], associated_data)[0]
+
+    def decrypt_many(self, values, associated_data=None):
+        aad = associated_data.encode('utf-8') if associated_data else None
+        plaintexts = []
+        for value in values:
+            if not self.is_encrypted(value):
+                # Rows written before encryption was enabled are returned as-is.
+                plaintexts.append(value)
+                continue
+            _, key_id, wrapped_b64, payload = value.split(TOKEN_SEPARATOR)
+            data_key = self._get_key(key_id, wrapped_b64)
+            payload = b64decode(payload)
+            nonce, ciphertext = payload[:NONCE_SIZE], payload[NONCE_SIZE:]
+            plaintexts.append(data_key.cipher.decrypt(nonce, ciphertext, aad).decode('utf-8'))
+        return plaintexts
+
+
+@lru_cache(maxsize=None)
+def get_encryption_engine():
+    config = settings.CARD_ENCRYPTION
+    keystore = LocalKeyStore(config['MASTER_KEYS'], config['ACTIVE_MASTER_KEY_ID'])
+    return EncryptionEngine(keystore,
+                            max_uses=config['DATA_KEY_MAX_USES'],
+                            max_age=config['DATA_KEY_MAX_AGE'])
@@ -0,0 +1,92 @@
+from datetime import date
+from functools import lru_cache
+from operator import itemgetter
+
+from .serializers import CreditCardSerializer, decrypt_card_representations
+
+
+def to_iso_date(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    return value or None
+
+
+def to_holder(value):
+    holder_id, holder_name = value
+    return {'id': holder_id, 'name': holder_name}
+
+
+def to_holder_id(value):
+    return value
+
+
+class FastField:
+    def __init__(self, name, columns, converter):
+        self.name = name
+        self.columns = columns
+        self.converter = converter
+
+
+class FastSerializer:
+    # Turns values_list() rows into the same dicts the DRF serializers
+    # build, without going through the per-object field machinery.
+
+    def __init__(self, fields, post_process=None):
+        self.columns = []
+        self._plan = []
+        for field in fields:
+            start = len(self.columns)
+            self.columns.extend(field.columns)
+            indexes = range(start, len(self.columns))
+            self._plan.append((field.name, itemgetter(*indexes), field.converter))
+        self.post_process = post_process
+
+    def serialize(self, rows):
+        plan = self._plan
+        results = []
+        for row in rows:
+            item = {}
+            for name, getter, converter in plan:
+                value = getter(row)
+                item[name] = None if value is None else converter(value)
+            results.append(item)
+        if self.post_process:
+            self.post_process(results)
+        return results
+
+
+CREDIT_CARD_FAST_FIELDS = {
+    'id': FastField('id', ['id'], int),
+    'exp_date': FastField('exp_date', ['exp_date'], to_iso_date),
+    'holder': FastField('holder', ['holder_id'], to_holder_id),
+    'number': FastField('number', ['number'], str),
+    'cvv': FastField('cvv', ['cvv'], str),
+    'brand': FastField('brand', ['brand'], str),
+    'version': FastField('version', ['version'], int),
+}
+EXPANDED_HOLDER_FAST_FIELD = FastField('holder', ['holder_id', 'holder__name'], to_holder)
+
+HOLDER_FAST_FIELDS = {
+    'id': FastField('id', ['id'], int),
+    'name': FastField('name', ['name'], str),
+}
+
+
+@lru_cache(maxsize=None)
+def get_credit_card_fast_serializer(fields, expand_holder):
+    fast_fields = []
+    for field_name in CreditCardSerializer.Meta.fields:
+        if field_name not in fields:
+            continue
+        if field_name == 'holder' and expand_holder:
+            fast_fields.append(EXPANDED_HOLDER_FAST_FIELD)
+        else:
+            fast_fields.append(CREDIT_CARD_FAST_FIELDS[field_name])
+    return FastSerializer(fast_fields, post_process=decrypt_card_representations)
+
+
+@lru_cache(maxsize=None)
+def get_holder_fast_serializer(fields):
+    return FastSerializer([HOLDER_FAST_FIELDS[field_name]
+                           for field_name in HOLDER_FAST_FIELDS
+                           if field_name in fields])
@@ -0,0 +1,15 @@
+import time
+
+
+def measure(repeat, func):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def per_row(elapsed, rows):
+    return elapsed * 1000000 / rows
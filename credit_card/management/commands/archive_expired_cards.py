@@ -0,0 +1,66 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from credit_card.models import ArchivedCreditCard, CreditCard
+
+
+ARCHIVED_COLUMNS = ['id', 'exp_date', 'number', 'cvv', 'holder_id', 'brand', 'version']
+
+
+class Command(BaseCommand):
+    help = 'Moves expired credit cards from the live table to the archive in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-batches', type=int, default=None)
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='Seconds to wait between batches.')
+
+    def handle(self, *args, **options):
+        today = date.today()
+        batches = 0
+        archived = 0
+
+        while options['max_batches'] is None or batches < options['max_batches']:
+            read, moved = self.archive_batch(today, options['batch_size'])
+            if not read:
+                break
+            batches += 1
+            archived += moved
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(f'Archived {archived} expired credit cards in {batches} batches.')
+
+    @staticmethod
+    def archive_batch(today, batch_size):
+        with transaction.atomic():
+            # skip_locked leaves rows being updated for a later batch; it is
+            # a no-op on SQLite, where the version check below covers races.
+            rows = list(CreditCard.objects.select_for_update(skip_locked=True)
+                        .filter(exp_date__lt=today)
+                        .order_by('exp_date')
+                        .values(*ARCHIVED_COLUMNS)[:batch_size])
+            if not rows:
+                return 0, 0
+
+            # Only delete rows still at the version that was read, so a PATCH
+            # committed in between is neither lost nor archived stale.
+            CreditCard.objects.filter(read_versions_filter(rows)).delete()
+            remaining = set(CreditCard.objects.filter(id__in=[row['id'] for row in rows])
+                            .values_list('id', flat=True))
+            archived_rows = [row for row in rows if row['id'] not in remaining]
+            ArchivedCreditCard.objects.bulk_create(
+                [ArchivedCreditCard(**row) for row in archived_rows])
+            return len(rows), len(archived_rows)
+
+
+def read_versions_filter(rows):
+    versions = Q()
+    for row in rows:
+        versions |= Q(id=row['id'], version=row['version'])
+    return versions
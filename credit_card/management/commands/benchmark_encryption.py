@@ -0,0 +1,64 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from credit_card.management.benchmark import measure, per_row
+from credit_card.encryption import get_encryption_engine
+from credit_card.fast_serializers import get_credit_card_fast_serializer
+from credit_card.models import CreditCard, Holder
+from credit_card.serializers import CreditCardSerializer, encrypt_card_data
+
+
+class Command(BaseCommand):
+    help = 'Measures per-row encryption overhead on /credit-cards/ pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        engine = get_encryption_engine()
+        holder = Holder(id=1, name='Benchmark Holder')
+        fast_serializer = get_credit_card_fast_serializer(tuple(CreditCardSerializer.Meta.fields), True)
+
+        for page_size in options['page_sizes']:
+            numbers = [f'4539578763{index:06d}' for index in range(page_size)]
+
+            encrypt_time = measure(options['repeat'],
+                                   lambda: engine.encrypt_many(numbers, 'number'))
+            tokens = engine.encrypt_many(numbers, 'number')
+            decrypt_time = measure(options['repeat'],
+                                   lambda: engine.decrypt_many(tokens, 'number'))
+
+            # Time the same fast path the /credit-cards/ list endpoint uses.
+            plain_cards = self.build_cards(holder, numbers)
+            encrypted_cards = [
+                CreditCard(id=card.id, holder=holder, exp_date=card.exp_date, brand=card.brand,
+                           **encrypt_card_data({'number': card.number, 'cvv': card.cvv}))
+                for card in plain_cards]
+            plain_rows = self.build_rows(fast_serializer, plain_cards)
+            encrypted_rows = self.build_rows(fast_serializer, encrypted_cards)
+            plain_page_time = measure(options['repeat'],
+                                      lambda: fast_serializer.serialize(plain_rows))
+            encrypted_page_time = measure(options['repeat'],
+                                          lambda: fast_serializer.serialize(encrypted_rows))
+
+            self.stdout.write(
+                f'page_size={page_size} '
+                f'encrypt={per_row(encrypt_time, page_size):.1f}us/row '
+                f'decrypt={per_row(decrypt_time, page_size):.1f}us/row '
+                f'page_plain={per_row(plain_page_time, page_size):.1f}us/row '
+                f'page_encrypted={per_row(encrypted_page_time, page_size):.1f}us/row '
+                f'overhead={per_row(encrypted_page_time - plain_page_time, page_size):.1f}us/row')
+
+    @staticmethod
+    def build_cards(holder, numbers):
+        return [CreditCard(id=index + 1, holder=holder, number=number, cvv='123',
+                           exp_date=date(2035, 12, 31), brand='visa')
+                for index, number in enumerate(numbers)]
+
+    @staticmethod
+    def build_rows(fast_serializer, cards):
+        return [tuple(card.holder.name if column == 'holder__name' else getattr(card, column)
+                      for column in fast_serializer.columns)
+                for card in cards]
@@ -0,0 +1,50 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from credit_card.management.benchmark import measure, per_row
+from credit_card.fast_serializers import get_credit_card_fast_serializer, get_holder_fast_serializer
+from credit_card.models import CreditCard, Holder
+from credit_card.serializers import CreditCardSerializer, HolderSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compares per-row cost of the DRF and fast-path list serializers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        repeat = options['repeat']
+        holders = [Holder(id=index + 1, name=f'Holder {index}') for index in range(page_size)]
+        cards = [CreditCard(id=index + 1, holder=holder, number=f'4539578763{index:06d}', cvv='123',
+                            exp_date=date(2035, 12, 31), brand='visa', version=1)
+                 for index, holder in enumerate(holders)]
+
+        card_fields = tuple(CreditCardSerializer.Meta.fields)
+        card_serializer = get_credit_card_fast_serializer(card_fields, True)
+        card_rows = [tuple(self.column_value(card, column) for column in card_serializer.columns)
+                     for card in cards]
+        holder_serializer = get_holder_fast_serializer(('id', 'name'))
+        holder_rows = [(holder.id, holder.name) for holder in holders]
+
+        self.report('credit-cards', page_size,
+                    measure(repeat, lambda: CreditCardSerializer(cards, many=True).data),
+                    measure(repeat, lambda: card_serializer.serialize(card_rows)))
+        self.report('holders', page_size,
+                    measure(repeat, lambda: HolderSerializer(holders, many=True).data),
+                    measure(repeat, lambda: holder_serializer.serialize(holder_rows)))
+
+    @staticmethod
+    def column_value(card, column):
+        if column == 'holder__name':
+            return card.holder.name
+        return getattr(card, column)
+
+    def report(self, name, page_size, drf_time, fast_time):
+        drf_per_row = per_row(drf_time, page_size)
+        fast_per_row = per_row(fast_time, page_size)
+        self.stdout.write(f'{name} page_size={page_size} drf={drf_per_row:.1f}us/row '
+                          f'fast={fast_per_row:.1f}us/row speedup={drf_per_row / fast_per_row:.1f}x')
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from credit_card.encryption import get_encryption_engine
+from credit_card.models import ArchivedCreditCard, CreditCard
+from credit_card.serializers import ENCRYPTED_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Encrypts card numbers and CVVs stored before encryption was enabled.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        engine = get_encryption_engine()
+        for model in (CreditCard, ArchivedCreditCard):
+            updated = 0
+            last_id = 0
+            while True:
+                cards = list(model.objects.filter(id__gt=last_id).order_by('id')
+                             .only('id', *ENCRYPTED_FIELDS)[:options['batch_size']])
+                if not cards:
+                    break
+
+                changed = {}
+                for field_name in ENCRYPTED_FIELDS:
+                    plain_cards = [card for card in cards
+                                   if not engine.is_encrypted(getattr(card, field_name))]
+                    tokens = engine.encrypt_many(
+                        [getattr(card, field_name) for card in plain_cards], field_name)
+                    for card, token in zip(plain_cards, tokens):
+                        setattr(card, field_name, token)
+                        changed[card.id] = card
+
+                model.objects.bulk_update(list(changed.values()), ENCRYPTED_FIELDS)
+                updated += len(changed)
+                last_id = cards[-1].id
+
+            self.stdout.write(f'Encrypted {updated} {model._meta.verbose_name_plural}.')
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from credit_card.models import ArchivedCreditCard, CreditCard, Holder, normalize_holder_name
+
+
+class Command(BaseCommand):
+    help = ('Fills Holder.normalized_name for holders created before it existed, '
+            'merging holders whose names only differ by case or spacing.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        updated = 0
+        merged = 0
+        last_id = 0
+        while True:
+            holders = list(Holder.objects.filter(id__gt=last_id).order_by('id')
+                           .only('id', 'name', 'normalized_name')[:options['batch_size']])
+            if not holders:
+                break
+
+            batch_updated, batch_merged = self.normalize_batch(holders)
+            updated += batch_updated
+            merged += batch_merged
+            last_id = holders[-1].id
+
+        self.stdout.write(f'Normalized {updated} holder names, merged {merged} duplicate holders.')
+
+    @staticmethod
+    def normalize_batch(holders):
+        changed = [holder for holder in holders
+                   if holder.normalized_name != normalize_holder_name(holder.name)]
+        if not changed:
+            return 0, 0
+
+        with transaction.atomic():
+            normalized_names = {normalize_holder_name(holder.name) for holder in changed}
+            holder_ids = {}
+            existing = Holder.objects.filter(normalized_name__in=normalized_names).order_by('id')
+            for holder_id, normalized_name in existing.values_list('id', 'normalized_name'):
+                holder_ids.setdefault(normalized_name, holder_id)
+
+            to_update = []
+            duplicates = {}
+            for holder in changed:
+                normalized_name = normalize_holder_name(holder.name)
+                if normalized_name in holder_ids:
+                    duplicates[holder.id] = holder_ids[normalized_name]
+                else:
+                    holder_ids[normalized_name] = holder.id
+                    holder.normalized_name = normalized_name
+                    to_update.append(holder)
+
+            for duplicate_id, holder_id in duplicates.items():
+                CreditCard.objects.filter(holder_id=duplicate_id).update(holder_id=holder_id)
+                ArchivedCreditCard.objects.filter(holder_id=duplicate_id).update(holder_id=holder_id)
+            Holder.objects.filter(id__in=list(duplicates)).delete()
+            Holder.objects.bulk_update(to_update, ['normalized_name'])
+
+        return len(to_update), len(duplicates)
@@ -1,21 +1,54 @@
 from django.db import models
 from django.core.validators import MinLengthValidator
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
+from .encryption import get_encryption_engine
+
+
+def normalize_holder_name(name):
+    return ' '.join(name.split()).casefold()
 
 
 class Holder(models.Model):
     name = models.CharField(max_length=255, validators=[MinLengthValidator(2)])
+    normalized_name = models.CharField(max_length=255, db_index=True, editable=False, default='')
+
+    class Meta:
+        constraints = [
+            # Rows created before normalized_name existed keep '' until
+            # normalize_holder_names fills them in and merges duplicates.
+            models.UniqueConstraint(fields=['normalized_name'],
+                                    condition=~models.Q(normalized_name=''),
+                                    name='unique_holder_normalized_name'),
+        ]
 
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_holder_name(self.name)
+        super().save(*args, **kwargs)
 
-class CreditCard(models.Model):
-    exp_date = models.DateField()
+
+class BaseCreditCard(models.Model):
+    exp_date = models.DateField(db_index=True)
     number = models.CharField(max_length=255)
-    cvv = models.CharField(max_length=4, validators=[MinLengthValidator(3)])
+    cvv = models.CharField(max_length=255, validators=[MinLengthValidator(3)])
     holder = models.ForeignKey(Holder, on_delete=models.CASCADE)
     brand = models.CharField(max_length=25)
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        abstract = True
 
     def __str__(self):
-        return f'{self.brand} ending with {self.number[-4:]}'
+        number = get_encryption_engine().decrypt(self.number, 'number')
+        return f'{self.brand} ending with {number[-4:]}'
+
+
+class CreditCard(BaseCreditCard):
+    pass
+
+
+class ArchivedCreditCard(BaseCreditCard):
+    id = models.BigIntegerField(primary_key=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
 
 
 class UserRole(models.TextChoices):
@@ -0,0 +1,165 @@
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connection
+from django.urls import reverse
+
+from .utils import is_truthy
+
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_QUERY_PARAM = 'profile'
+PROFILE_STATS_LIMIT = 50
+
+request_counter = itertools.count(1)
+
+
+class ProfileStore:
+    # Keeps at most max_profiles files on disk, the oldest by mtime are removed.
+
+    def __init__(self, directory, max_profiles):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def path(self, profile_id):
+        return os.path.join(self.directory, f'{profile_id}.json')
+
+    def save(self, profile):
+        profile_id = str(uuid.uuid4())
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(profile_id), 'w') as profile_file:
+            json.dump(dict(profile, id=profile_id), profile_file)
+        self.prune()
+        return profile_id
+
+    def prune(self):
+        profiles = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                try:
+                    profiles.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+
+        profiles.sort()
+        for _, path in profiles[:max(len(profiles) - self.max_profiles, 0)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def load(self, profile_id):
+        try:
+            profile_id = str(uuid.UUID(str(profile_id)))
+        except ValueError:
+            return None
+        try:
+            with open(self.path(profile_id)) as profile_file:
+                return json.load(profile_file)
+        except FileNotFoundError:
+            return None
+
+
+def get_profile_store():
+    config = settings.REQUEST_PROFILING
+    return ProfileStore(config['DIRECTORY'], config['MAX_PROFILES'])
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({'sql': sql,
+                                 'duration_ms': (time.perf_counter() - start) * 1000})
+
+
+class RequestProfiler:
+    def __init__(self, mode):
+        self.mode = mode
+        self.profiler = cProfile.Profile()
+        self.queries = QueryRecorder()
+        self._stack = ExitStack()
+
+    def start(self):
+        self._stack.enter_context(connection.execute_wrapper(self.queries))
+        self.started_at = time.perf_counter()
+        self.profiler.enable()
+
+    def stop(self, request, response=None):
+        try:
+            self.profiler.disable()
+            duration_ms = (time.perf_counter() - self.started_at) * 1000
+        finally:
+            self._stack.close()
+
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_STATS_LIMIT)
+        return {
+            'mode': self.mode,
+            'method': request.method,
+            'path': request.get_full_path(),
+            # No response means the handler raised an unhandled exception.
+            'status_code': response.status_code if response is not None else 500,
+            'duration_ms': duration_ms,
+            'sql_duration_ms': sum(query['duration_ms'] for query in self.queries.queries),
+            'sql': self.queries.queries,
+            'stats': stream.getvalue(),
+        }
+
+
+class ProfilingMixin:
+    def get_profiling_mode(self, request):
+        if (is_truthy(request.META.get(PROFILE_HEADER, ''))
+                or is_truthy(request.query_params.get(PROFILE_QUERY_PARAM, ''))) \
+                and getattr(request.user, 'is_admin', False):
+            return 'on-demand'
+
+        sample_rate = settings.REQUEST_PROFILING['SAMPLE_RATE']
+        if sample_rate and next(request_counter) % sample_rate == 0:
+            return 'sampled'
+        return None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        mode = self.get_profiling_mode(request)
+        if mode:
+            self.request_profiler = RequestProfiler(mode)
+            self.request_profiler.start()
+
+    def dispatch(self, request, *args, **kwargs):
+        self.request_profiler = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # finalize_response is skipped when an exception escapes dispatch,
+            # the profiler must still be switched off and the profile kept.
+            if self.request_profiler:
+                self.save_profile(self.request, None)
+
+    def save_profile(self, request, response):
+        request_profiler = self.request_profiler
+        self.request_profiler = None
+        return request_profiler.mode, get_profile_store().save(request_profiler.stop(request, response))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.request_profiler:
+            mode, profile_id = self.save_profile(request, response)
+            if mode == 'on-demand':
+                response['X-Profile-Id'] = profile_id
+                response['X-Profile-Url'] = request.build_absolute_uri(
+                    reverse('profile-detail', kwargs={'pk': profile_id}))
+        return response
@@ -1,31 +1,118 @@
 from rest_framework import serializers
-from .models import CreditCard, Holder, User
+from .encryption import get_encryption_engine
+from .models import CreditCard, Holder, User, normalize_holder_name
 
 
-class HolderSerializer(serializers.ModelSerializer):
+ENCRYPTED_FIELDS = ['number', 'cvv']
+
+
+def encrypt_card_data(data):
+    data = dict(data)
+    engine = get_encryption_engine()
+    for field_name in ENCRYPTED_FIELDS:
+        if field_name in data:
+            data[field_name] = engine.encrypt(data[field_name], field_name)
+    return data
+
+
+def decrypt_card_representations(representations):
+    engine = get_encryption_engine()
+    for field_name in ENCRYPTED_FIELDS:
+        rows = [row for row in representations if field_name in row]
+        values = engine.decrypt_many([row[field_name] for row in rows], field_name)
+        for row, value in zip(rows, values):
+            row[field_name] = value
+    return representations
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class HolderSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Holder
-        fields = '__all__'
+        fields = ['id', 'name']
+
+    def validate_name(self, value):
+        holders = Holder.objects.filter(normalized_name=normalize_holder_name(value))
+        if self.instance is not None:
+            holders = holders.exclude(pk=self.instance.pk)
+        if holders.exists():
+            raise serializers.ValidationError('A holder with this name already exists.')
+        return value
+
 
+class CreditCardListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        return decrypt_card_representations(super().to_representation(data))
 
-class CreditCardSerializer(serializers.ModelSerializer):
+
+class CreditCardSerializer(DynamicFieldsModelSerializer):
     holder = serializers.PrimaryKeyRelatedField(queryset=Holder.objects.all())
 
+    def __init__(self, *args, **kwargs):
+        self.expand_holder = kwargs.pop('expand_holder', True)
+        super().__init__(*args, **kwargs)
+
     class Meta:
         model = CreditCard
-        fields = ['id', 'exp_date', 'holder', 'number', 'cvv', 'brand']
+        fields = ['id', 'exp_date', 'holder', 'number', 'cvv', 'brand', 'version']
+        read_only_fields = ['version']
+        list_serializer_class = CreditCardListSerializer
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['holder'] = {'id': representation['holder'],
-                                    'name': instance.holder.name}
+        if self.expand_holder and 'holder' in representation:
+            representation['holder'] = {'id': representation['holder'],
+                                        'name': instance.holder.name}
+        if not isinstance(self.parent, serializers.ListSerializer):
+            decrypt_card_representations([representation])
         return representation
 
 
+class HolderWithCardsSerializer(HolderSerializer):
+    card_count = serializers.IntegerField(read_only=True)
+    cards = CreditCardSerializer(source='limited_cards', many=True, read_only=True,
+                                 fields=['id', 'exp_date', 'number', 'cvv', 'brand'])
+
+    class Meta:
+        model = Holder
+        fields = ['id', 'name', 'card_count', 'cards']
+
+
+class HolderBulkUpsertSerializer(serializers.Serializer):
+    names = serializers.ListField(
+        child=serializers.CharField(min_length=2, max_length=255),
+        allow_empty=False,
+        max_length=5000,
+    )
+
+
 class CreditCardCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = CreditCard
         fields = ['exp_date', 'holder', 'number', 'cvv', 'brand']
+        extra_kwargs = {'cvv': {'max_length': 4}}
+
+    def create(self, validated_data):
+        return super().create(encrypt_card_data(validated_data))
+
+    def to_representation(self, instance):
+        return decrypt_card_representations([super().to_representation(instance)])[0]
+
+
+class CreditCardUpdateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CreditCard
+        fields = ['exp_date', 'number', 'cvv']
+        extra_kwargs = {'cvv': {'max_length': 4}}
 
 
 class UserSerializer(serializers.ModelSerializer):
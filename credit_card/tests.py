@@ -1,5 +1,12 @@
 from datetime import date, timedelta
-from django.test import TestCase
+import os
+import sys
+import tempfile
+from unittest import mock
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status
@@ -11,7 +18,13 @@ from credit_card.serializers import (
     HolderSerializer,
     UserSerializer,
 )
-from credit_card.models import Holder, CreditCard, User, UserRole
+from credit_card import views
+from credit_card.management.commands import archive_expired_cards
+from credit_card.models import ArchivedCreditCard, Holder, CreditCard, User, UserRole
+from credit_card.encryption import EncryptionEngine, LocalKeyStore, get_encryption_engine
+from credit_card.profiling import get_profile_store
+from credit_card.fast_serializers import get_credit_card_fast_serializer, get_holder_fast_serializer
+from cryptography.exceptions import InvalidTag
 
 
 class ModelSerializerTestCase(TestCase):
@@ -46,6 +59,16 @@ class ModelSerializerTestCase(TestCase):
         self.assertIsInstance(credit_card, CreditCard)
         self.assertEqual(str(credit_card), 'Mastercard ending with 4444')
 
+    def test_encrypted_credit_card_str(self):
+        credit_card = CreditCardCreateSerializer().create({
+            'exp_date': date.today(),
+            'number': '5555555555554444',
+            'cvv': '123',
+            'holder': self.holder,
+            'brand': 'Mastercard',
+        })
+        self.assertEqual(str(credit_card), 'Mastercard ending with 4444')
+
     def test_user_creation(self):
         user = User.objects.create_user(
             name='newuser',
@@ -94,7 +117,8 @@ class ModelSerializerTestCase(TestCase):
             'holder': {'id': self.holder.id, 'name': 'John Doe'},
             'number': '4111111111111111',
             'cvv': '123',
-            'brand': 'Visa'
+            'brand': 'Visa',
+            'version': 1
         }
         self.assertEqual(serializer.data, expected_data)
 
@@ -115,6 +139,80 @@ class ModelSerializerTestCase(TestCase):
         self.assertEqual(serializer.data, expected_data)
 
 
+class EncryptionEngineTestCase(TestCase):
+    def setUp(self):
+        self.keystore = LocalKeyStore({'key-1': 'first secret', 'key-2': 'second secret'}, 'key-1')
+        self.engine = EncryptionEngine(self.keystore, max_uses=3)
+
+    def test_encrypt_decrypt_round_trip(self):
+        tokens = self.engine.encrypt_many(['4111111111111111', '5555555555554444'], 'number')
+        self.assertTrue(all(self.engine.is_encrypted(token) for token in tokens))
+        self.assertNotIn('4111111111111111', tokens[0])
+        self.assertEqual(self.engine.decrypt_many(tokens, 'number'), ['4111111111111111', '5555555555554444'])
+
+    def test_decrypt_passes_plaintext_through(self):
+        self.assertEqual(self.engine.decrypt('4111111111111111', 'number'), '4111111111111111')
+
+    def test_decrypt_with_wrong_context_fails(self):
+        token = self.engine.encrypt('123', 'cvv')
+        with self.assertRaises(InvalidTag):
+            self.engine.decrypt(token, 'number')
+
+    def test_data_key_rotates_after_max_uses(self):
+        first, second, third = self.engine.encrypt_many(['1', '2', '3'])
+        fourth = self.engine.encrypt('4')
+        self.assertEqual(first.rsplit('$', 1)[0], third.rsplit('$', 1)[0])
+        self.assertNotEqual(first.rsplit('$', 1)[0], fourth.rsplit('$', 1)[0])
+        self.assertEqual(self.engine.decrypt_many([first, fourth]), ['1', '4'])
+
+    def test_master_key_rotation(self):
+        old_token = self.engine.encrypt('4111111111111111')
+        self.keystore.active_key_id = 'key-2'
+        new_token = self.engine.encrypt('4111111111111111')
+        self.assertIn('$key-2$', new_token)
+        fresh_engine = EncryptionEngine(self.keystore)
+        self.assertEqual(fresh_engine.decrypt_many([old_token, new_token]), ['4111111111111111'] * 2)
+
+
+class FastSerializerParityTestCase(TestCase):
+    def setUp(self):
+        self.holder1 = Holder.objects.create(name='Holder 1')
+        self.holder2 = Holder.objects.create(name='Holder 2')
+        CreditCardCreateSerializer().create({
+            'exp_date': date(2035, 3, 31),
+            'holder': self.holder1,
+            'number': '4539578763621486',
+            'cvv': '1234',
+            'brand': 'visa',
+        })
+        CreditCard.objects.create(exp_date='2030-01-31', number='5555555555554444', cvv='123',
+                                  holder=self.holder2, brand='mastercard')
+
+    def assert_credit_card_parity(self, fields, expand_holder):
+        fast_serializer = get_credit_card_fast_serializer(tuple(fields), expand_holder)
+        rows = CreditCard.objects.order_by('id').values_list(*fast_serializer.columns)
+        serializer = CreditCardSerializer(CreditCard.objects.order_by('id'), many=True,
+                                          fields=fields, expand_holder=expand_holder)
+        fast_data = fast_serializer.serialize(rows)
+        self.assertEqual(fast_data, serializer.data)
+        self.assertEqual([list(row) for row in fast_data], [list(row) for row in serializer.data])
+
+    def test_credit_card_parity(self):
+        self.assert_credit_card_parity(list(CreditCardSerializer.Meta.fields), True)
+
+    def test_credit_card_parity_without_holder_expansion(self):
+        self.assert_credit_card_parity(list(CreditCardSerializer.Meta.fields), False)
+
+    def test_credit_card_parity_with_fields(self):
+        self.assert_credit_card_parity(['brand', 'holder', 'id'], True)
+
+    def test_holder_parity(self):
+        fast_serializer = get_holder_fast_serializer(('id', 'name'))
+        rows = Holder.objects.order_by('id').values_list(*fast_serializer.columns)
+        serializer = HolderSerializer(Holder.objects.order_by('id'), many=True)
+        self.assertEqual(fast_serializer.serialize(rows), serializer.data)
+
+
 class HolderViewTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -152,6 +250,89 @@ class HolderViewTestCase(TestCase):
         response = self.client.delete(reverse('holder-detail', kwargs={'pk': self.holder1.id}), HTTP_AUTHORIZATION=f'Token {self.token}')
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_get_holders_by_ids(self):
+        response = self.client.get(reverse('holder-list') + f'?ids={self.holder2.id},{self.holder1.id},999')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([holder['id'] for holder in response.data['results']], [self.holder2.id, self.holder1.id])
+        self.assertEqual(response.data['missing'], [999])
+
+    def test_batch_holders(self):
+        data = {'ids': [self.holder1.id, 999]}
+        response = self.client.post(reverse('holder-batch'), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{'id': self.holder1.id, 'name': 'Holder 1'}])
+        self.assertEqual(response.data['missing'], [999])
+
+    def test_get_holders_with_fields(self):
+        response = self.client.get(reverse('holder-list') + '?fields=name')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{'name': 'Holder 1'}, {'name': 'Holder 2'}])
+
+    def test_get_holders_with_invalid_fields(self):
+        response = self.client.get(reverse('holder-list') + '?fields=name,cvv')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_upsert_holders(self):
+        data = {'names': ['holder 1', 'New  Holder', 'Holder 2', 'new holder', 'HOLDER 1']}
+        with self.assertNumQueries(6):
+            response = self.client.post(reverse('holder-bulk-upsert'), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 1)
+
+        new_holder = Holder.objects.get(normalized_name='new holder')
+        self.assertEqual(new_holder.name, 'New Holder')
+        self.assertEqual(list(response.data['holders'].items()), [
+            ('holder 1', self.holder1.id),
+            ('New  Holder', new_holder.id),
+            ('Holder 2', self.holder2.id),
+            ('new holder', new_holder.id),
+            ('HOLDER 1', self.holder1.id),
+        ])
+
+        response = self.client.post(reverse('holder-bulk-upsert'), data=data, format='json')
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(Holder.objects.count(), 3)
+
+    def test_bulk_upsert_holders_with_invalid_name(self):
+        data = {'names': ['Valid Name', 'x']}
+        response = self.client.post(reverse('holder-bulk-upsert'), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Holder.objects.count(), 2)
+
+    def test_normalize_holder_names_command(self):
+        Holder.objects.filter(pk=self.holder1.pk).update(normalized_name='')
+        duplicate = Holder.objects.create(name='Holder One')
+        Holder.objects.filter(pk=duplicate.pk).update(name='HOLDER  1', normalized_name='')
+        credit_card = CreditCard.objects.create(holder=duplicate, number='4539578763621486',
+                                                exp_date=date.today(), cvv='123')
+
+        out = StringIO()
+        call_command('normalize_holder_names', stdout=out)
+        self.assertIn('Normalized 1 holder names, merged 1 duplicate holders.', out.getvalue())
+        self.holder1.refresh_from_db()
+        self.assertEqual(self.holder1.normalized_name, 'holder 1')
+        self.assertFalse(Holder.objects.filter(pk=duplicate.pk).exists())
+        credit_card.refresh_from_db()
+        self.assertEqual(credit_card.holder_id, self.holder1.id)
+
+    def test_create_duplicate_holder(self):
+        response = self.client.post(reverse('holder-list'), data={'name': ' holder  1'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Holder.objects.count(), 2)
+
+    def test_bulk_upsert_holders_with_concurrent_insert(self):
+        # Another run inserts the holder between our lookup and our insert.
+        late_holder = Holder.objects.create(name='Late Holder')
+        find_holder_ids = views.find_holder_ids
+        stale_lookup = {'holder 1': self.holder1.id}
+        with mock.patch('credit_card.views.find_holder_ids',
+                        side_effect=[stale_lookup, find_holder_ids(['late holder'])]):
+            response = self.client.post(reverse('holder-bulk-upsert'),
+                                        data={'names': ['Holder 1', 'late holder']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['holders'], {'Holder 1': self.holder1.id, 'late holder': late_holder.id})
+        self.assertEqual(Holder.objects.filter(normalized_name='late holder').count(), 1)
+
     def test_create_user(self):
         data = {'name': 'testuser', 'password': 'testpassword', 'role': UserRole.ADMIN}
         response = self.client.post(reverse('user-create'), data=data, HTTP_AUTHORIZATION=f'Token {self.token}')
@@ -211,6 +392,55 @@ class CreditCardViewTestCase(APITestCase):
         response = self.client.post(reverse('credit-card-list'), data=data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_create_credit_card_with_upserted_holder_name(self):
+        data = {'names': ['  bob  smith', 'Bob Smith']}
+        response = self.client.post(reverse('holder-bulk-upsert'), data=data, format='json')
+        holder_id = response.data['holders']['Bob Smith']
+
+        data = {
+            "exp_date": "03/2035",
+            "holder": "BOB SMITH",
+            "number": "4539578763621486",
+            "cvv": "1234"
+        }
+        response = self.client.post(reverse('credit-card-list'), data=data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['holder'], holder_id)
+
+    def test_encrypt_existing_cards_command(self):
+        out = StringIO()
+        call_command('encrypt_existing_cards', '--batch-size', '1', stdout=out)
+        self.assertIn('Encrypted 2 credit cards.', out.getvalue())
+
+        engine = get_encryption_engine()
+        self.credit_card1.refresh_from_db()
+        self.assertTrue(engine.is_encrypted(self.credit_card1.cvv))
+        self.assertEqual(engine.decrypt(self.credit_card1.number, 'number'), '4539578763621486')
+        self.assertEqual(engine.decrypt(self.credit_card1.cvv, 'cvv'), '123')
+
+        out = StringIO()
+        call_command('encrypt_existing_cards', stdout=out)
+        self.assertIn('Encrypted 0 credit cards.', out.getvalue())
+
+    def test_create_credit_card_stores_encrypted_values(self):
+        data = {
+            "exp_date": "03/2035",
+            "holder": self.holder1.name,
+            "number": "4539578763621486",
+            "cvv": "1234"
+        }
+        response = self.client.post(reverse('credit-card-list'), data=data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['number'], '4539578763621486')
+
+        credit_card = CreditCard.objects.latest('id')
+        self.assertNotEqual(credit_card.number, '4539578763621486')
+        self.assertNotEqual(credit_card.cvv, '1234')
+
+        response = self.client.get(reverse('credit-card-list') + '?page_size=100')
+        self.assertEqual(response.data['results'][-1]['number'], '4539578763621486')
+        self.assertEqual(response.data['results'][-1]['cvv'], '1234')
+
     def test_create_credit_card_with_invalid_holder(self):
         data = {
             'holder': 'Invalid Holder Name',
@@ -239,4 +469,327 @@ class CreditCardViewTestCase(APITestCase):
         }
         response = self.client.post(reverse('credit-card-list'), data=data)
 
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_credit_cards_by_ids(self):
+        url = reverse('credit-card-list') + f'?ids={self.credit_card2.id},{self.credit_card1.id},999'
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([cc['id'] for cc in response.data['results']], [self.credit_card2.id, self.credit_card1.id])
+        self.assertEqual(response.data['results'][0]['holder'], {'id': self.holder2.id, 'name': 'Holder 2'})
+        self.assertEqual(response.data['missing'], [999])
+
+    def test_batch_credit_cards_with_bare_list(self):
+        response = self.client.post(reverse('credit-card-batch'), data=[self.credit_card1.id, 999], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['missing'], [999])
+
+    def test_batch_credit_cards_with_non_integer_ids(self):
+        for ids in ([True, 1.7], [self.credit_card1.id, '2'], [1.0]):
+            response = self.client.post(reverse('credit-card-batch'), data={'ids': ids}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_credit_cards_with_invalid_body(self):
+        response = self.client.post(reverse('credit-card-batch'), data='"abc"', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_credit_cards_by_invalid_ids(self):
+        response = self.client.get(reverse('credit-card-list') + '?ids=1,abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_credit_cards(self):
+        data = {'ids': [self.credit_card1.id, 999]}
+        response = self.client.post(reverse('credit-card-batch'), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['missing'], [999])
+
+    def test_get_credit_card_with_fields(self):
+        url = reverse('credit-card-detail', kwargs={'pk': self.credit_card1.id}) + '?fields=id,brand'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'id': self.credit_card1.id, 'brand': ''})
+
+    def test_list_credit_cards_without_holder_expansion(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('credit-card-list') + '?fields=id,holder&expand=')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0], {'id': self.credit_card1.id, 'holder': self.holder1.id})
+
+    def test_list_credit_cards_with_holder_expansion(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('credit-card-list') + '?fields=id,holder&expand=holder')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['holder'], {'id': self.holder1.id, 'name': 'Holder 1'})
+
+    def test_list_credit_cards_with_invalid_fields(self):
+        response = self.client.get(reverse('credit-card-list') + '?fields=id,password')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_holder_cards(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('holder-cards', kwargs={'pk': self.holder1.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['id'], self.credit_card1.id)
+
+    def test_list_holder_cards_with_invalid_holder(self):
+        response = self.client.get(reverse('holder-cards', kwargs={'pk': 999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_holders_including_cards(self):
+        for _ in range(11):
+            CreditCard.objects.create(holder=self.holder1, number='4539578763621486',
+                                      exp_date=timezone.now() + timedelta(days=30), cvv=123)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('holder-list') + '?include=cards')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['card_count'], 12)
+        self.assertEqual(len(response.data[0]['cards']), 10)
+        self.assertEqual(response.data[0]['cards'][0]['id'], self.credit_card1.id)
+        self.assertEqual(response.data[1]['card_count'], 1)
+        self.assertEqual([cc['id'] for cc in response.data[1]['cards']], [self.credit_card2.id])
+
+    def test_patch_credit_card(self):
+        data = {'version': 1, 'cvv': '789', 'holder': self.holder2.name}
+        response = self.client.patch(reverse('credit-card-detail', kwargs={'pk': self.credit_card1.id}), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'id': self.credit_card1.id, 'version': 2, 'cvv': '789', 'holder': self.holder2.id})
+        self.credit_card1.refresh_from_db()
+        self.assertEqual(get_encryption_engine().decrypt(self.credit_card1.cvv, 'cvv'), '789')
+        self.assertEqual(self.credit_card1.holder, self.holder2)
+        self.assertEqual(self.credit_card1.version, 2)
+
+    def test_patch_credit_card_number_updates_brand(self):
+        data = {'version': 1, 'number': '5555555555554444'}
+        response = self.client.patch(reverse('credit-card-detail', kwargs={'pk': self.credit_card1.id}), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.credit_card1.refresh_from_db()
+        self.assertEqual(self.credit_card1.brand, response.data['brand'])
+        self.assertNotEqual(self.credit_card1.number, '5555555555554444')
+
+    def test_patch_credit_card_ignores_brand(self):
+        data = {'version': 1, 'brand': 'bogus'}
+        response = self.client.patch(reverse('credit-card-detail', kwargs={'pk': self.credit_card1.id}), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.credit_card1.refresh_from_db()
+        self.assertEqual(self.credit_card1.brand, '')
+
+        data = {'version': 1, 'cvv': '789', 'brand': 'bogus'}
+        response = self.client.patch(reverse('credit-card-detail', kwargs={'pk': self.credit_card1.id}), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('brand', response.data)
+        self.credit_card1.refresh_from_db()
+        self.assertEqual(self.credit_card1.brand, '')
+
+    def test_patch_credit_card_with_stale_version(self):
+        data = {'version': 5, 'cvv': '789'}
+        response = self.client.patch(reverse('credit-card-detail', kwargs={'pk': self.credit_card1.id}), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_patch_credit_card_without_version(self):
+        data = {'cvv': '789'}
+        response = self.client.patch(reverse('credit-card-detail', kwargs={'pk': self.credit_card1.id}), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_patch_credit_card_with_list_body(self):
+        response = self.client.patch(reverse('credit-card-detail', kwargs={'pk': self.credit_card1.id}), data=[1, 2], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_patch_invalid_credit_card(self):
+        data = {'version': 1, 'cvv': '789'}
+        response = self.client.patch(reverse('credit-card-detail', kwargs={'pk': 999}), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CreditCardArchiveTestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin_user = User.objects.create_superuser(name='adminuser', password='adminpassword')
+        self.token = Token.objects.create(user=self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.holder = Holder.objects.create(name='Holder 1')
+        self.expired_cards = [
+            CreditCard.objects.create(holder=self.holder, number='4539578763621486',
+                                      exp_date=date.today() - timedelta(days=days), cvv='123')
+            for days in (1, 40, 400)
+        ]
+        self.expiring_card = CreditCard.objects.create(
+            holder=self.holder, number='4539578763621486',
+            exp_date=date.today() + timedelta(days=10), cvv='123')
+        self.active_card = CreditCard.objects.create(
+            holder=self.holder, number='4539578763621486',
+            exp_date=date.today() + timedelta(days=100), cvv='123')
+
+    def archive(self):
+        out = StringIO()
+        call_command('archive_expired_cards', '--batch-size', '2', stdout=out)
+        return out.getvalue()
+
+    def test_archive_expired_cards(self):
+        self.assertIn('Archived 3 expired credit cards in 2 batches.', self.archive())
+        self.assertEqual(set(CreditCard.objects.values_list('id', flat=True)),
+                         {self.expiring_card.id, self.active_card.id})
+        self.assertEqual(set(ArchivedCreditCard.objects.values_list('id', flat=True)),
+                         {card.id for card in self.expired_cards})
+
+    def test_archive_expired_cards_with_max_batches(self):
+        out = StringIO()
+        call_command('archive_expired_cards', '--batch-size', '2', '--max-batches', '1', stdout=out)
+        self.assertEqual(ArchivedCreditCard.objects.count(), 2)
+        self.assertEqual(CreditCard.objects.count(), 3)
+
+    def test_archive_skips_cards_updated_during_batch(self):
+        updated_card = self.expired_cards[0]
+        read_versions_filter = archive_expired_cards.read_versions_filter
+
+        def update_then_filter(rows):
+            CreditCard.objects.filter(pk=updated_card.pk).update(cvv='999', version=2)
+            return read_versions_filter(rows)
+
+        with mock.patch.object(archive_expired_cards, 'read_versions_filter', side_effect=update_then_filter):
+            out = StringIO()
+            call_command('archive_expired_cards', '--batch-size', '5', '--max-batches', '1', stdout=out)
+
+        self.assertIn('Archived 2 expired credit cards in 1 batches.', out.getvalue())
+        self.assertFalse(ArchivedCreditCard.objects.filter(pk=updated_card.pk).exists())
+        updated_card.refresh_from_db()
+        self.assertEqual((updated_card.cvv, updated_card.version), ('999', 2))
+
+        self.archive()
+        self.assertEqual(ArchivedCreditCard.objects.get(pk=updated_card.pk).version, 2)
+
+    def test_list_credit_cards_include_archived(self):
+        self.archive()
+        response = self.client.get(reverse('credit-card-list'))
+        self.assertEqual(response.data['count'], 2)
+
+        response = self.client.get(reverse('credit-card-list') + '?include_archived=true&page_size=10')
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(response.data['results'][0]['holder'], {'id': self.holder.id, 'name': 'Holder 1'})
+
+    def test_list_credit_cards_include_archived_is_ordered(self):
+        self.archive()
+        all_ids = sorted(card.id for card in self.expired_cards + [self.expiring_card, self.active_card])
+
+        response = self.client.get(reverse('credit-card-list') + '?include_archived=true&page_size=2&page=2')
+        self.assertEqual([cc['id'] for cc in response.data['results']], all_ids[2:4])
+
+        response = self.client.get(reverse('credit-card-list') + '?include_archived=true&fields=brand&page_size=10')
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(response.data['results'][0], {'brand': ''})
+
+    def test_get_archived_credit_card(self):
+        self.archive()
+        url = reverse('credit-card-detail', kwargs={'pk': self.expired_cards[0].id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get(url + '?include_archived=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], self.expired_cards[0].id)
+
+    def test_list_expiring_credit_cards(self):
+        response = self.client.get(reverse('credit-card-expiring') + '?within=30')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([cc['id'] for cc in response.data['results']], [self.expiring_card.id])
+
+        response = self.client.get(reverse('credit-card-expiring') + '?within=365')
+        self.assertEqual([cc['id'] for cc in response.data['results']],
+                         [self.expiring_card.id, self.active_card.id])
+
+    def test_list_expiring_credit_cards_with_invalid_within(self):
+        response = self.client.get(reverse('credit-card-expiring') + '?within=soon')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProfilingTestCase(APITestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+        self.profiling_settings = override_settings(REQUEST_PROFILING={
+            'SAMPLE_RATE': 0,
+            'DIRECTORY': self.profile_dir.name,
+            'MAX_PROFILES': 2,
+        })
+        self.profiling_settings.enable()
+        self.addCleanup(self.profiling_settings.disable)
+
+        self.client = APIClient()
+        self.admin_user = User.objects.create_superuser(name='adminuser', password='adminpassword')
+        self.token = Token.objects.create(user=self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        Holder.objects.create(name='Holder 1')
+
+    def test_profile_on_demand(self):
+        response = self.client.get(reverse('holder-list'), HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('X-Profile-Url', response)
+
+        response = self.client.get(reverse('profile-detail', kwargs={'pk': response['X-Profile-Id']}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['mode'], 'on-demand')
+        self.assertEqual(response.data['path'], reverse('holder-list'))
+        self.assertTrue(response.data['sql'])
+        self.assertIn('function calls', response.data['stats'])
+
+    def test_profile_unhandled_exception(self):
+        with mock.patch('credit_card.views.get_holder_fast_serializer', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.get(reverse('holder-list') + '?profile=1')
+
+        self.assertIsNone(sys.getprofile())
+        self.assertEqual(connection.execute_wrappers, [])
+        profiles = os.listdir(self.profile_dir.name)
+        self.assertEqual(len(profiles), 1)
+        with open(os.path.join(self.profile_dir.name, profiles[0])) as profile_file:
+            self.assertIn('"status_code": 500', profile_file.read())
+
+    def test_profile_query_flag(self):
+        response = self.client.get(reverse('credit-card-list') + '?profile=1')
+        self.assertIn('X-Profile-Id', response)
+
+    def test_profile_flag_off(self):
+        response = self.client.get(reverse('credit-card-list') + '?profile=0')
+        self.assertNotIn('X-Profile-Id', response)
+        response = self.client.get(reverse('credit-card-list'), HTTP_X_PROFILE='false')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.profile_dir.name), [])
+
+    def test_profile_ignored_for_non_admin(self):
+        user = User.objects.create_user(name='worker', password='workerpassword', role=UserRole.NON_ADMIN)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user)}')
+        data = {'name': 'newuser', 'password': 'newpassword', 'role': UserRole.NON_ADMIN}
+        response = client.post(reverse('user-create'), data=data, HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.profile_dir.name), [])
+
+    def test_no_profile_by_default(self):
+        response = self.client.get(reverse('holder-list'))
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.profile_dir.name), [])
+
+    def test_sampled_profiles_use_ring_buffer(self):
+        with override_settings(REQUEST_PROFILING={'SAMPLE_RATE': 1,
+                                                  'DIRECTORY': self.profile_dir.name,
+                                                  'MAX_PROFILES': 2}):
+            for _ in range(3):
+                response = self.client.get(reverse('holder-list'))
+                self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(len(os.listdir(self.profile_dir.name)), 2)
+
+    def test_profile_store_removes_oldest(self):
+        store = get_profile_store()
+        first, second = store.save({'mode': 'sampled'}), store.save({'mode': 'sampled'})
+        os.utime(store.path(second), (1, 1))
+        third = store.save({'mode': 'sampled'})
+        self.assertIsNone(store.load(second))
+        self.assertEqual(store.load(first)['id'], first)
+        self.assertEqual(store.load(third)['id'], third)
+
+    def test_get_missing_profile(self):
+        response = self.client.get(reverse('profile-detail', kwargs={'pk': '00000000-0000-0000-0000-000000000000'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
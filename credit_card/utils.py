@@ -2,7 +2,6 @@ from datetime import datetime, date
 import calendar
 from creditcard import CreditCard
 from creditcard.exceptions import BrandNotFound
-import hashlib
 
 
 def is_valid_date_format(date_str):
@@ -41,13 +40,42 @@ def get_cc_brand(cc_number):
         return False
 
 
-def encrypt_cc_number(cc_number):
-    cc_number_bytes = cc_number.encode('utf-8')
-    hash_object = hashlib.sha256()
+def parse_ids(ids):
+    if isinstance(ids, str):
+        try:
+            parsed = [int(item) for item in ids.split(',') if item.strip()]
+        except ValueError:
+            return None
+    elif isinstance(ids, (list, tuple)):
+        if any(isinstance(item, bool) or not isinstance(item, int) for item in ids):
+            return None
+        parsed = list(ids)
+    else:
+        return None
+    return list(dict.fromkeys(parsed))
 
-    hash_object.update(cc_number_bytes)
-    digest_bytes = hash_object.digest()
 
-    digest_hex = digest_bytes.hex()
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
-    return digest_hex
+
+def fetch_by_ids(queryset, ids, chunk_size):
+    found = {}
+    for chunk in chunked(ids, chunk_size):
+        for obj in queryset.filter(pk__in=chunk):
+            found[obj.pk] = obj
+    objects = [found[pk] for pk in ids if pk in found]
+    missing = [pk for pk in ids if pk not in found]
+    return objects, missing
+
+
+def parse_fields(fields_str, allowed_fields):
+    fields = [field.strip() for field in fields_str.split(',') if field.strip()]
+    if not fields or any(field not in allowed_fields for field in fields):
+        return None
+    return list(dict.fromkeys(fields))
+
+
+def is_truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes')
@@ -1,17 +1,27 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import CreditCard, Holder
+from .models import ArchivedCreditCard, CreditCard, Holder, normalize_holder_name
 from .serializers import (CreditCardCreateSerializer,
                           CreditCardSerializer,
+                          CreditCardUpdateSerializer,
+                          HolderBulkUpsertSerializer,
                           HolderSerializer,
-                          UserSerializer)
+                          HolderWithCardsSerializer,
+                          UserSerializer,
+                          encrypt_card_data)
+from .profiling import ProfilingMixin, get_profile_store
+from .fast_serializers import get_credit_card_fast_serializer, get_holder_fast_serializer
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery
+from datetime import date, timedelta
 from .utils import (
     is_valid_date_format,
     get_last_day_of_month,
     is_date_valid, check_if_cc_is_valid,
-    get_cc_brand, encrypt_cc_number)
+    get_cc_brand,
+    parse_ids, fetch_by_ids, parse_fields, is_truthy, chunked)
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.pagination import PageNumberPagination
 from drf_yasg.utils import swagger_auto_schema
@@ -25,25 +35,182 @@ class CustomPagination(PageNumberPagination):
     max_page_size = 1000
 
 
-class CreditCardView(APIView):
+BATCH_CHUNK_SIZE = 500
+MAX_BATCH_IDS = 1000
+
+CREDIT_CARD_FIELDS = CreditCardSerializer.Meta.fields
+HOLDER_FIELDS = ['id', 'name']
+HOLDER_CARDS_LIMIT = 10
+DEFAULT_EXPIRING_WITHIN_DAYS = 30
+MAX_EXPIRING_WITHIN_DAYS = 3650
+
+
+def get_requested_fields(request, allowed_fields):
+    fields_str = request.query_params.get('fields')
+    if fields_str is None:
+        return list(allowed_fields)
+    return parse_fields(fields_str, allowed_fields)
+
+
+def get_credit_card_queryset(fields, expand_holder, model=CreditCard):
+    queryset = model.objects.all()
+    columns = list(fields)
+    if 'holder' in fields and expand_holder:
+        queryset = queryset.select_related('holder')
+        columns.append('holder__name')
+    return queryset.only(*columns)
+
+
+def get_holder_queryset(fields, include_cards):
+    queryset = Holder.objects.only(*fields)
+    if include_cards:
+        first_card_ids = CreditCard.objects.filter(
+            holder=OuterRef('holder')).order_by('id').values('pk')[:HOLDER_CARDS_LIMIT]
+        cards = CreditCard.objects.filter(
+            pk__in=Subquery(first_card_ids)).order_by('id')
+        queryset = queryset.annotate(card_count=Count('creditcard')).prefetch_related(
+            Prefetch('creditcard_set', queryset=cards, to_attr='limited_cards'))
+    return queryset
+
+
+def get_batch_ids(data):
+    if isinstance(data, list):
+        return data
+    if hasattr(data, 'get'):
+        return data.get('ids')
+    return None
+
+
+def batch_fetch_response(queryset, serializer_class, raw_ids, **serializer_kwargs):
+    ids = parse_ids(raw_ids)
+    if not ids:
+        return Response({'error': 'Invalid ids, use a list of integers.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    if len(ids) > MAX_BATCH_IDS:
+        return Response({'error': f'Too many ids, the limit is {MAX_BATCH_IDS}.'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    objects, missing = fetch_by_ids(queryset, ids, BATCH_CHUNK_SIZE)
+    serializer = serializer_class(objects, many=True, **serializer_kwargs)
+    return Response({'results': serializer.data, 'missing': missing},
+                    status=status.HTTP_200_OK)
+
+
+def find_holder_ids(normalized_names):
+    holder_ids = {}
+    for chunk in chunked(normalized_names, BATCH_CHUNK_SIZE):
+        holders = Holder.objects.filter(normalized_name__in=chunk).order_by('id')
+        for holder_id, normalized_name in holders.values_list('id', 'normalized_name'):
+            holder_ids.setdefault(normalized_name, holder_id)
+    return holder_ids
+
+
+def upsert_holders(names):
+    display_names = {}
+    for name in names:
+        display_names.setdefault(normalize_holder_name(name), ' '.join(name.split()))
+
+    with transaction.atomic():
+        holder_ids = find_holder_ids(list(display_names))
+        new_holders = [Holder(name=display_name, normalized_name=normalized_name)
+                       for normalized_name, display_name in display_names.items()
+                       if normalized_name not in holder_ids]
+        # A concurrent upsert may insert the same names first, the unique
+        # constraint turns those rows into no-ops and the re-select finds them.
+        Holder.objects.bulk_create(new_holders, batch_size=BATCH_CHUNK_SIZE, ignore_conflicts=True)
+        holder_ids.update(find_holder_ids([holder.normalized_name for holder in new_holders]))
+
+    return {name: holder_ids[normalize_holder_name(name)] for name in names}, len(new_holders)
+
+
+def clean_credit_card_data(data):
+    holder = data.get('holder')
+    exp_date = data.get('exp_date')
+    cc_number = data.get('number')
+
+    if holder:
+        holder_obj = (Holder.objects.filter(normalized_name=normalize_holder_name(holder))
+                      .order_by('id').first())
+        if holder_obj is None:
+            return Response({'error': 'Holder not found.'},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        data['holder'] = holder_obj.id
+
+    if exp_date:
+        if not is_valid_date_format(exp_date):
+            return Response({'error': 'Wrong date format, use MM/YYYY.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        elif not is_date_valid(get_last_day_of_month(exp_date)):
+            return Response({'error': 'Date expired.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        data['exp_date'] = get_last_day_of_month(exp_date)
+
+    if cc_number:
+        if not check_if_cc_is_valid(cc_number):
+            return Response({'error': 'Credit Card number is not valid.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if not get_cc_brand(cc_number):
+            return Response({'error': 'This CC has a invalid brand.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        data['brand'] = get_cc_brand(cc_number)
+
+    return None
+
+
+class CreditCardView(ProfilingMixin, APIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     def get(self, request, pk=None):
+        fields = get_requested_fields(request, CREDIT_CARD_FIELDS)
+        if fields is None:
+            return Response({'error': f'Invalid fields, choose from {", ".join(CREDIT_CARD_FIELDS)}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        expand_holder = 'holder' in request.query_params.get('expand', 'holder').split(',')
+        credit_cards = get_credit_card_queryset(fields, expand_holder)
+        serializer_kwargs = {'fields': fields, 'expand_holder': expand_holder}
+        include_archived = is_truthy(request.query_params.get('include_archived', ''))
+
         if pk:
             try:
-                credit_card = CreditCard.objects.get(pk=pk)
+                credit_card = credit_cards.get(pk=pk)
             except ObjectDoesNotExist:
+                credit_card = None
+
+            if credit_card is None and include_archived:
+                archived_cards = get_credit_card_queryset(fields, expand_holder, ArchivedCreditCard)
+                credit_card = archived_cards.filter(pk=pk).first()
+
+            if credit_card is None:
                 return Response({'error': 'Credit Card not found.'},
                                 status=status.HTTP_404_NOT_FOUND)
 
-            serializer = CreditCardSerializer(credit_card)
+            serializer = CreditCardSerializer(credit_card, **serializer_kwargs)
             return Response(serializer.data)
+        elif 'ids' in request.query_params:
+            return batch_fetch_response(credit_cards,
+                                        CreditCardSerializer,
+                                        request.query_params.get('ids'),
+                                        **serializer_kwargs)
         else:
+            fast_serializer = get_credit_card_fast_serializer(tuple(fields), expand_holder)
+            columns = fast_serializer.columns
+            rows = CreditCard.objects.values_list(*columns)
+            if include_archived:
+                # The serializer ignores trailing columns, so id can be added for ordering.
+                if 'id' not in columns:
+                    columns = columns + ['id']
+                rows = CreditCard.objects.values_list(*columns).union(
+                    ArchivedCreditCard.objects.values_list(*columns), all=True).order_by('id')
             paginator = CustomPagination()
-            credit_cards = CreditCard.objects.all()
-            result_page = paginator.paginate_queryset(credit_cards, request)
-            serializer = CreditCardSerializer(result_page, many=True)
-            return paginator.get_paginated_response(serializer.data)
+            result_page = paginator.paginate_queryset(rows, request)
+            return paginator.get_paginated_response(fast_serializer.serialize(result_page))
 
     def delete(self, request, pk):
         try:
@@ -69,65 +236,144 @@ class CreditCardView(APIView):
     )
     def post(self, request):
         data = request.data.copy()
-        holder = data.get('holder')
-        exp_date = data.get('exp_date')
-        cc_number = data.get('number')
+        error_response = clean_credit_card_data(data)
+        if error_response:
+            return error_response
 
-        if holder:
-            try:
-                holder_obj = Holder.objects.filter(name=holder).first().id
-            except AttributeError:
-                return Response({'error': 'Holder not found.'},
-                                status=status.HTTP_404_NOT_FOUND)
+        serializer = CreditCardCreateSerializer(data=data)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        print(5)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            data['holder'] = holder_obj
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['version'],
+            properties={
+                'version': openapi.Schema(type=openapi.TYPE_INTEGER, description='Current version of the credit card.'),
+                'exp_date': openapi.Schema(type=openapi.TYPE_STRING, format='date', description='Expiration date in MM/YYYY format.'),
+                'holder': openapi.Schema(type=openapi.TYPE_STRING, description='Holder name.'),
+                'number': openapi.Schema(type=openapi.TYPE_STRING, description='Credit card number.'),
+                'cvv': openapi.Schema(type=openapi.TYPE_STRING, description='CVV code.'),
+            }
+        )
+    )
+    def patch(self, request, pk):
+        if not isinstance(request.data, dict):
+            return Response({'error': 'The request body must be an object.'},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-        if exp_date:
-            if not is_valid_date_format(exp_date):
-                return Response({'error': 'Wrong date format, use MM/YYYY.'},
-                                status=status.HTTP_400_BAD_REQUEST)
+        data = request.data.copy()
+        try:
+            version = int(data.get('version'))
+        except (TypeError, ValueError):
+            return Response({'error': 'The current version is required.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        data.pop('version')
+        data.pop('brand', None)
 
-            elif not is_date_valid(get_last_day_of_month(exp_date)):
-                return Response({'error': 'Date expired.'},
-                                status=status.HTTP_400_BAD_REQUEST)
+        error_response = clean_credit_card_data(data)
+        if error_response:
+            return error_response
 
-            data['exp_date'] = get_last_day_of_month(exp_date)
+        holder_id = data.get('holder')
+        data.pop('holder', None)
+        brand = data.get('brand')
+        data.pop('brand', None)
+        serializer = CreditCardUpdateSerializer(data=data, partial=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        if cc_number:
-            if not check_if_cc_is_valid(cc_number):
-                return Response({'error': 'Credit Card number is not valid.'},
-                                status=status.HTTP_400_BAD_REQUEST)
+        changes = encrypt_card_data(serializer.validated_data)
+        if holder_id:
+            changes['holder_id'] = holder_id
+        if brand:
+            changes['brand'] = brand
+        if not changes:
+            return Response({'error': 'No fields to update.'},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-            if not get_cc_brand(cc_number):
-                return Response({'error': 'This CC has a invalid brand.'},
-                                status=status.HTTP_400_BAD_REQUEST)
+        updated = CreditCard.objects.filter(pk=pk, version=version).update(
+            version=F('version') + 1, **changes)
+        if not updated:
+            if not CreditCard.objects.filter(pk=pk).exists():
+                return Response({'error': 'Credit Card not found.'},
+                                status=status.HTTP_404_NOT_FOUND)
+            return Response({'error': 'Credit Card was modified by another request.'},
+                            status=status.HTTP_409_CONFLICT)
 
-            data['brand'] = get_cc_brand(cc_number)
-            data['number'] = encrypt_cc_number(cc_number)
+        response_data = {'id': pk, 'version': version + 1}
+        for field_name, value in serializer.validated_data.items():
+            response_data[field_name] = serializer.fields[field_name].to_representation(value)
+        if holder_id:
+            response_data['holder'] = holder_id
+        if brand:
+            response_data['brand'] = brand
+        return Response(response_data, status=status.HTTP_200_OK)
 
-        serializer = CreditCardCreateSerializer(data=data)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        print(5)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class CreditCardExpiringView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        try:
+            within = int(request.query_params.get('within', DEFAULT_EXPIRING_WITHIN_DAYS))
+        except ValueError:
+            within = -1
+
+        if not 0 <= within <= MAX_EXPIRING_WITHIN_DAYS:
+            return Response({'error': f'Invalid within, use a number of days up to {MAX_EXPIRING_WITHIN_DAYS}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-class HolderView(APIView):
+        today = date.today()
+        fast_serializer = get_credit_card_fast_serializer(tuple(CREDIT_CARD_FIELDS), True)
+        rows = CreditCard.objects.filter(
+            exp_date__gte=today,
+            exp_date__lte=today + timedelta(days=within),
+        ).order_by('exp_date', 'id').values_list(*fast_serializer.columns)
+        paginator = CustomPagination()
+        result_page = paginator.paginate_queryset(rows, request)
+        return paginator.get_paginated_response(fast_serializer.serialize(result_page))
+
+
+class HolderView(ProfilingMixin, APIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     def get(self, request, pk=None):
+        fields = get_requested_fields(request, HOLDER_FIELDS)
+        if fields is None:
+            return Response({'error': f'Invalid fields, choose from {", ".join(HOLDER_FIELDS)}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        include_cards = 'cards' in request.query_params.get('include', '').split(',')
+        holders = get_holder_queryset(fields, include_cards)
+        if include_cards:
+            serializer_class = HolderWithCardsSerializer
+            fields = fields + ['card_count', 'cards']
+        else:
+            serializer_class = HolderSerializer
+
         if pk:
             try:
-                holder = Holder.objects.get(pk=pk)
+                holder = holders.get(pk=pk)
             except ObjectDoesNotExist:
                 return Response({'error': 'Holder not found.'},
                                 status=status.HTTP_404_NOT_FOUND)
 
-            serializer = HolderSerializer(holder)
+            serializer = serializer_class(holder, fields=fields)
+        elif 'ids' in request.query_params:
+            return batch_fetch_response(holders,
+                                        serializer_class,
+                                        request.query_params.get('ids'),
+                                        fields=fields)
+        elif include_cards:
+            serializer = serializer_class(holders, many=True, fields=fields)
         else:
-            holders = Holder.objects.all()
-            serializer = HolderSerializer(holders, many=True)
+            fast_serializer = get_holder_fast_serializer(tuple(fields))
+            return Response(fast_serializer.serialize(Holder.objects.values_list(*fast_serializer.columns)),
+                            status=status.HTTP_200_OK)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -162,7 +408,80 @@ class HolderView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class UserCreateView(APIView):
+class HolderCardsView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request, pk):
+        if not Holder.objects.filter(pk=pk).exists():
+            return Response({'error': 'Holder not found.'},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        paginator = CustomPagination()
+        credit_cards = CreditCard.objects.filter(holder_id=pk).select_related('holder').order_by('id')
+        result_page = paginator.paginate_queryset(credit_cards, request)
+        serializer = CreditCardSerializer(result_page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class HolderBulkUpsertView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['names'],
+            properties={
+                'names': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING), description='Holder names.'),
+            }
+        )
+    )
+    def post(self, request):
+        serializer = HolderBulkUpsertSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        holder_ids, created = upsert_holders(serializer.validated_data['names'])
+        return Response({'holders': holder_ids, 'created': created},
+                        status=status.HTTP_200_OK)
+
+
+class CreditCardBatchView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['ids'],
+            properties={
+                'ids': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER), description='Credit card ids.'),
+            }
+        )
+    )
+    def post(self, request):
+        return batch_fetch_response(CreditCard.objects.select_related('holder'),
+                                    CreditCardSerializer,
+                                    get_batch_ids(request.data))
+
+
+class HolderBatchView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['ids'],
+            properties={
+                'ids': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER), description='Holder ids.'),
+            }
+        )
+    )
+    def post(self, request):
+        return batch_fetch_response(Holder.objects.all(),
+                                    HolderSerializer,
+                                    get_batch_ids(request.data))
+
+
+class UserCreateView(ProfilingMixin, APIView):
     def post(self, request, format=None):
         serializer = UserSerializer(data=request.data)
         if serializer.is_valid():
@@ -172,4 +491,16 @@ class UserCreateView(APIView):
                 'name': user.name,
                 'role': user.role,
             }, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ProfileView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request, pk):
+        profile = get_profile_store().load(pk)
+        if profile is None:
+            return Response({'error': 'Profile not found.'},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        return Response(profile, status=status.HTTP_200_OK)